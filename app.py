@@ -1,87 +1,148 @@
 # app.py
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
 from pipeline.abilities.knowledge_base_search import KnowledgeBaseSearch
+from src.langie.cache import LRUCache
+from src.langie.logger import get_logger
+from src.langie.tickets import TicketStore, ticket_status
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
-import json
+import asyncio
+import msgspec
 import os
-
-app = FastAPI()
+import time
+
+logger = get_logger(__name__)
+
+# Threads used for blocking work (KB search, ticket writes) off the event loop
+WORKER_THREADS = int(os.getenv("LANGIE_WORKER_THREADS", "64"))
+
+@asynccontextmanager
+async def lifespan(app):
+    global _ticket_queue
+    # asyncio.to_thread() runs on the loop's default executor; size it explicitly
+    executor = ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="langie")
+    asyncio.get_running_loop().set_default_executor(executor)
+    _ticket_queue = asyncio.Queue()
+    writer = asyncio.create_task(ticket_writer(_ticket_queue))
+    yield
+    # Flush pending tickets before shutting down
+    await _ticket_queue.join()
+    writer.cancel()
+    _ticket_queue = None
+    executor.shutdown(wait=True)
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Mount static files (frontend)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Load pipeline components
-kb_search = KnowledgeBaseSearch(config={"db_path": "data/chroma", "collection": "faq", "top_k": 3})
-
-# File to store tickets
-TICKETS_FILE = "data/tickets.json"
-
-# Ticket counter (for TKT-XXX IDs)
-def get_next_ticket_id():
-    if not os.path.exists(TICKETS_FILE):
-        return "TKT-001"
-    with open(TICKETS_FILE, "r") as f:
+kb_search = KnowledgeBaseSearch(config={
+    "db_path": "data/chroma",
+    "collection": "faq",
+    "top_k": 3,
+    "quantized": os.getenv("LANGIE_KB_QUANTIZED", "1") == "1",
+    "oversample": 8,
+    "batch_window_ms": float(os.getenv("LANGIE_BATCH_WINDOW_MS", "10")),
+    "max_batch": 32,
+})
+
+# Ticket store (SQLite, WAL); ids are allocated by the database, see src/langie/tickets.py
+ticket_store = TicketStore()
+
+# Tickets are persisted after the reply is sent, by a single writer task (see lifespan)
+TICKET_WRITE_BATCH = 100
+_ticket_queue = None
+
+async def ticket_writer(queue):
+    """Drain queued tickets, committing up to TICKET_WRITE_BATCH per transaction."""
+    while True:
+        batch = [await queue.get()]
+        while len(batch) < TICKET_WRITE_BATCH and not queue.empty():
+            batch.append(queue.get_nowait())
         try:
-            tickets = json.load(f)
-            if not tickets:
-                return "TKT-001"
-            last_id = tickets[-1]["ticket_id"]
-            num = int(last_id.split("-")[1])
-            return f"TKT-{num + 1:03d}"
+            # Falls back to row-by-row writes; only tickets that still fail are dead-lettered
+            await asyncio.to_thread(ticket_store.save_many, batch)
         except Exception:
-            return "TKT-001"
-
-# Save ticket
-def save_ticket(ticket):
-    tickets = []
-    if os.path.exists(TICKETS_FILE):
-        with open(TICKETS_FILE, "r") as f:
-            try:
-                tickets = json.load(f)
-            except json.JSONDecodeError:
-                tickets = []
-    tickets.append(ticket)
-    with open(TICKETS_FILE, "w") as f:
-        json.dump(tickets, f, indent=4)
-
-# Threshold score to mark as resolved
-SCORE_THRESHOLD = 0.25
-
-class ChatPayload(BaseModel):
+            logger.exception("❌ Failed to persist %d ticket(s)", len(batch))
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+# Queries not worth a retrieval: too short or a bare greeting -> pending ticket, no KB search
+MIN_QUERY_CHARS = 3
+GREETINGS = {
+    "hi", "hello", "hey", "hiya", "yo", "thanks", "thank you", "thx", "ok", "okay",
+    "good morning", "good afternoon", "good evening", "bye", "goodbye", "test",
+}
+
+# Identical query from the same email within this window reuses the previous KB results
+DEDUP_WINDOW_SECONDS = 1.0
+_recent_queries = LRUCache(maxsize=4096)
+
+def skip_kb_search(query: str) -> bool:
+    q = query.strip().lower()
+    return len(q) < MIN_QUERY_CHARS or q.rstrip("!.?, ") in GREETINGS
+
+class ChatPayload(msgspec.Struct):
     customer_name: str
     email: str
     query: str
 
+# Decodes request bytes straight into ChatPayload (validation included)
+_chat_decoder = msgspec.json.Decoder(ChatPayload)
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     with open("static/index.html") as f:
         return f.read()
 
 @app.post("/chat")
-async def chat(payload: ChatPayload):
+async def chat(request: Request):
+    try:
+        payload = _chat_decoder.decode(await request.body())
+    except msgspec.ValidationError as e:
+        return ORJSONResponse({"detail": str(e)}, status_code=422)
+    except msgspec.DecodeError as e:
+        return ORJSONResponse({"detail": f"Invalid JSON: {e}"}, status_code=400)
+
     state = {
         "input": {"text": payload.query},
         "customer_name": payload.customer_name,
         "email": payload.email
     }
 
-    # Run KB search
-    state = kb_search.run(state)
-    knowledge_base = state.get("knowledge_base", [])
+    query = payload.query.strip()
+    recent = _recent_queries.get(payload.email)
+    now = time.monotonic()
+
+    if skip_kb_search(query):
+        knowledge_base = []
+    elif recent and recent[0] == query and now - recent[1] <= DEDUP_WINDOW_SECONDS:
+        # Client retry / double submit: reuse the results from a moment ago
+        knowledge_base = recent[2]
+    else:
+        # Run KB search; concurrent queries are micro-batched into one encode in a worker thread
+        state = await kb_search.arun(state)
+        knowledge_base = state.get("knowledge_base", [])
+        _recent_queries.put(payload.email, (query, now, knowledge_base))
 
     # Determine main response and status
     if knowledge_base:
-        top_answer_data = knowledge_base[0]
-        top_answer = top_answer_data.get("answer", "No response generated")
-        status = "resolved" if top_answer_data.get("score", 0) >= SCORE_THRESHOLD else "pending"
+        top_hit = knowledge_base[0]
+        top_answer = top_hit.answer or "No response generated"
+        status = ticket_status(top_hit.score, kb_search.retriever.space)
     else:
         top_answer = "No response generated"
         status = "pending"
 
-    ticket_id = get_next_ticket_id()
+    # Unique across workers; usually in-memory, but claiming a new id block is a
+    # SQLite write, so keep it off the event loop
+    timestamp = datetime.utcnow().isoformat()
+    ticket_id = await asyncio.to_thread(ticket_store.reserve_id)
 
     ticket = {
         "ticket_id": ticket_id,
@@ -90,13 +151,16 @@ async def chat(payload: ChatPayload):
         "query": payload.query,
         "response": top_answer,
         "alternatives": [
-            {"answer": r.get("answer", ""), "score": r.get("score", 0)} for r in knowledge_base
+            {"answer": hit.answer or "", "score": hit.score or 0} for hit in knowledge_base
         ],
         "status": status,
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": timestamp
     }
 
-    # Save ticket to JSON file
-    save_ticket(ticket)
+    # Persist ticket after responding (directly if the writer task isn't running)
+    if _ticket_queue is not None:
+        _ticket_queue.put_nowait(ticket)
+    else:
+        await asyncio.to_thread(ticket_store.save, ticket)
 
-    return JSONResponse(ticket)
+    return ORJSONResponse(ticket)
@@ -0,0 +1,10 @@
+# conftest.py
+import pytest
+
+
+@pytest.fixture(scope="session")
+def retriever():
+    """One Retriever (model, Chroma client, index) for the whole test session."""
+    # Imported here so tests that need no model (quantization, caches, tickets) run without torch
+    from src.langie.retriever import get_retriever
+    return get_retriever()
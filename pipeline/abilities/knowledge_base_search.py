@@ -1,42 +1,155 @@
 # pipeline/abilities/knowledge_base_search.py
-from src.langie.retriever import Retriever
+import asyncio
+from collections import namedtuple
+
+from src.langie.cache import LRUCache
+from src.langie.quantization import INDEX_DIR
+from src.langie.retriever import get_retriever
+
+
+# One normalized KB result; built once per retrieval and reused from the caches as-is
+KBHit = namedtuple("KBHit", "id question answer score metadata")
+
+
+class BatchingRetriever:
+    """
+    Coalesces concurrent searches into a single `retriever.search_many` call
+    (a Retriever, or anything with the same search_many signature).
+    Queries arriving within `window_ms` of the first one (up to `max_batch`)
+    share one encode + Chroma query instead of paying for one each.
+    """
+
+    def __init__(self, retriever, window_ms: float = 10, max_batch: int = 32):
+        self.retriever = retriever
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = None
+        self._worker = None
+
+    async def search(self, query: str, top_k: int = 3):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._drain())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, top_k, future))
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        # The embedding function length-sorts the batch itself (smart batching)
+        top_k = max(item[1] for item in batch)
+        try:
+            results = await asyncio.to_thread(
+                self.retriever.search_many, [item[0] for item in batch], top_k
+            )
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, k, future), hits in zip(batch, results):
+            if not future.done():
+                future.set_result(hits[:k])
+
 
 class KnowledgeBaseSearch:
     def __init__(self, config=None):
-        # Config may hold db path, collection name, top-k, etc.
-        db_path = config.get("db_path", "data/chroma") if config else "data/chroma"
-        collection = config.get("collection", "faq") if config else "faq"
-        self.top_k = config.get("top_k", 3) if config else 3
+        # Config may hold db path, collection name, top-k, batching window, etc.
+        config = config or {}
+        db_path = config.get("db_path", "data/chroma")
+        collection = config.get("collection", "faq")
+        self.top_k = config.get("top_k", 3)
 
-        self.retriever = Retriever(db_path=db_path, collection_name=collection)
+        # quantized: shortlist top_k * oversample hits on the SQ8 sidecar, rerank top_k in fp16
+        self.retriever = get_retriever(
+            db_path=db_path,
+            collection_name=collection,
+            quantized=config.get("quantized", False),
+            index_dir=config.get("index_dir", INDEX_DIR),
+            oversample=config.get("oversample", 8),
+        )
+        # Exact normalized text + KB version (so adds and re-ingests invalidate it);
+        # near-duplicates are cached by the Retriever (skips the encode too)
+        self._exact_cache = LRUCache(maxsize=config.get("cache_size", 4096))
+        self.batcher = BatchingRetriever(
+            self,
+            window_ms=config.get("batch_window_ms", 10),
+            max_batch=config.get("max_batch", 32),
+        )
 
     def run(self, state: dict):
         query = state.get("input", {}).get("text", "")
         if not query:
-            state["knowledge_base"] = []
-            state["response"] = "No response generated"
-            return state
+            return self._store(state, [])
+        return self._store(state, self.search_many([query], top_k=self.top_k)[0])
+
+    async def arun(self, state: dict):
+        """Async variant of run(): exact-cache hits return at once, misses go through the micro-batcher."""
+        query = state.get("input", {}).get("text", "")
+        if not query:
+            return self._store(state, [])
+        hits = self._exact_cache.get(self._cache_key(query, self.top_k, self.retriever.kb_version()))
+        if hits is None:
+            hits = await self.batcher.search(query, top_k=self.top_k)
+        return self._store(state, hits)
 
-        results = self.retriever.search(query, top_k=self.top_k)
+    def search_many(self, queries, top_k: int = None):
+        """Cached search: exact-match LRU, then the retriever (which has its own semantic cache)."""
+        top_k = top_k or self.top_k
+        results = [None] * len(queries)
+        version = self.retriever.kb_version()
+        keys = [self._cache_key(q, top_k, version) for q in queries]
 
-        # Normalize into pipeline output
-        kb_results = []
-        for r in results:
-            kb_results.append({
-                "id": r.get("id"),
-                "question": r.get("question"),
-                "answer": r.get("answer"),
-                "score": r.get("score", 1.0),
-                "metadata": r.get("metadata", {})
-            })
+        misses = []
+        for i, key in enumerate(keys):
+            results[i] = self._exact_cache.get(key)
+            if results[i] is None:
+                misses.append(i)
+        if not misses:
+            return results
 
+        fresh = self.retriever.search_many([queries[i] for i in misses], top_k=top_k)
+        for i, raw_hits in zip(misses, fresh):
+            hits = [
+                KBHit(r.get("id"), r.get("question"), r.get("answer"),
+                      r.get("score", 1.0), r.get("metadata", {}))
+                for r in raw_hits
+            ]
+            results[i] = hits
+            self._exact_cache.put(keys[i], hits)
+        return results
+
+    @staticmethod
+    def _cache_key(query: str, top_k: int, version):
+        return query.strip().lower(), top_k, version
+
+    def clear_cache(self):
+        """Drop cached results, e.g. after the knowledge base was re-ingested."""
+        self._exact_cache.clear()
+        self.retriever.clear_cache()
+
+    def _store(self, state: dict, kb_results):
+        # kb_results is a list of KBHit (shared with the caches; treat as read-only)
         state["knowledge_base"] = kb_results
 
         # Pick top answer as main response
         if kb_results:
-            state["response"] = kb_results[0]["answer"]
+            state["response"] = kb_results[0].answer
         else:
             state["response"] = "No response generated"
 
         return state
-
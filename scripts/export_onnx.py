@@ -0,0 +1,33 @@
+# scripts/export_onnx.py
+import os
+import sys
+
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from transformers import AutoTokenizer
+
+# Allow `python scripts/export_onnx.py` from the repo root to import src.langie
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.langie.retriever import ONNX_MODEL_DIR, ONNX_MODEL_FILE
+
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+
+def export():
+    """Export all-MiniLM-L6-v2 to ONNX and dynamically quantize the weights to INT8."""
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+
+    # Equivalent to: optimum-cli export onnx --model <MODEL_ID> --task feature-extraction <dir>
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+    model.save_pretrained(ONNX_MODEL_DIR)
+    AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(ONNX_MODEL_DIR)
+
+    quantize_dynamic(
+        model_input=os.path.join(ONNX_MODEL_DIR, "model.onnx"),
+        model_output=os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+    print(f"✅ Exported INT8 ONNX model to {ONNX_MODEL_DIR}")
+
+if __name__ == "__main__":
+    export()
@@ -1,52 +1,55 @@
 # scripts/kb_ingest.py
-import json
 import os
-import chromadb
-from sentence_transformers import SentenceTransformer
-from chromadb.utils import embedding_functions
+import sys
 
-DATA_PATH = "data/kb_faq.json"
-DB_PATH = "data/chroma"
-COLLECTION_NAME = "faq"
+# Allow `python scripts/kb_ingest.py` from the repo root to import src.langie
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def load_faq(path: str):
-    """Load FAQ JSON file into a list of dicts with 'question' and 'answer'."""
-    with open(path, "r") as f:
-        return json.load(f)
+from src.langie.quantization import INDEX_DIR, QuantizedIndex
+from src.langie.retriever import (
+    COLLECTION_METADATA, KB_PATH, get_retriever, load_faqs, refresh_retrievers
+)
 
-def ingest():
-    # Init Chroma client (persistent)
-    client = chromadb.PersistentClient(path=DB_PATH)
+DATA_PATH = KB_PATH
+DB_PATH = "data/chroma"
+COLLECTION_NAME = "faq"
+BATCH_SIZE = 1024
 
-    # Use a SentenceTransformer wrapper (works offline too)
-    embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="all-MiniLM-L6-v2"  # downloaded once, then cached locally
-    )
+def main():
+    # The process-wide Retriever: same client, collection settings and embedding
+    # function as the app (INT8 ONNX if exported, else SentenceTransformers)
+    retriever = get_retriever(db_path=DB_PATH, collection_name=COLLECTION_NAME)
 
-    # Create or load collection with the embedding function
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        embedding_function=embedding_fn
-    )
+    # The distance space is fixed at creation; rebuild collections made with another one
+    if (retriever.collection.metadata or {}).get("hnsw:space") != COLLECTION_METADATA["hnsw:space"]:
+        retriever.client.delete_collection(COLLECTION_NAME)
+        retriever.refresh()  # recreates the collection with COLLECTION_METADATA
 
     # Load FAQ data
-    faqs = load_faq(DATA_PATH)
+    records = [
+        {"id": item.get("id") or f"faq-{i}",
+         "question": item.get("question", ""), "answer": item.get("answer", "")}
+        for i, item in enumerate(load_faqs(DATA_PATH))
+    ]
+
+    # Drop entries whose id is no longer in the source (removed FAQs, older id schemes)
+    keep = {r["id"] for r in records}
+    stale = [i for i in retriever.collection.get(include=[])["ids"] if i not in keep]
+    if stale:
+        retriever.collection.delete(ids=stale)
 
-    ids, texts, metadatas = [], [], []
-    for i, item in enumerate(faqs):
-        q = item.get("question", "").strip()
-        a = item.get("answer", "").strip()
+    # One batched encode + upsert per BATCH_SIZE records (refreshes existing ids in place)
+    if records:
+        embeddings = retriever.bulk_upsert(records, batch=BATCH_SIZE)
 
-        ids.append(f"faq-{i}")
-        texts.append(f"Q: {q}\nA: {a}")  # embed both Q & A
-        metadatas.append({"question": q, "answer": a})
+        # SQ8 sidecar index used by Retriever(quantized=True)
+        ids = [r["id"] for r in records]
+        QuantizedIndex.build(ids, embeddings, space=COLLECTION_METADATA["hnsw:space"]).save(INDEX_DIR)
 
-    # Clean old data (safe refresh)
-    if ids:
-        collection.delete(ids=ids)
-        collection.add(ids=ids, documents=texts, metadatas=metadatas)
+    # Shared retrievers in this process (e.g. quantized ones) drop stale handles, index and caches
+    refresh_retrievers(DB_PATH, COLLECTION_NAME)
 
-    print(f"✅ Ingested {len(faqs)} FAQ entries into ChromaDB at {DB_PATH}")
+    print(f"✅ Ingested {len(records)} FAQ entries into ChromaDB at {DB_PATH}")
 
 if __name__ == "__main__":
-    ingest()
+    main()
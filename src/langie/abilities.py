@@ -2,10 +2,45 @@
 import logging
 import re
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
+# Keyword -> (entity field, value). Matched in one pass by _KEYWORD_RE.
+_ENTITY_KEYWORDS = {
+    "refund": ("intent", "refund_request"),
+    "delay": ("issue", "delivery_delay"),
+    "late": ("issue", "delivery_delay"),
+    "haven't arrived": ("issue", "delivery_delay"),
+    "hasn’t arrived": ("issue", "delivery_delay"),
+    "invoice": ("product", "invoice_service"),
+}
+# Longest first so overlapping keywords prefer the more specific match
+_KEYWORD_RE = re.compile("|".join(
+    map(re.escape, sorted(_ENTITY_KEYWORDS, key=len, reverse=True))
+))
+_ORDER_ID_RE = re.compile(r"#\d+")
+_ANSWER_ID_RE = re.compile(r"#?\d+")
+_ASCII_DIGITS = frozenset("0123456789")
+
+
+def _find_order_id(text: str) -> Optional[str]:
+    """
+    First '#<digits>' in text (same as _ORDER_ID_RE.search). Most messages have
+    no '#' at all, so str.find rules that out before the regex engine is entered.
+    """
+    idx = text.find("#")
+    if idx < 0:
+        return None
+    end, n = idx + 1, len(text)
+    while end < n and text[end].isdecimal():
+        end += 1
+    if end > idx + 1:
+        return text[idx:end]
+    # '#' without digits right after it: let the regex look further on
+    m = _ORDER_ID_RE.search(text, end)
+    return m.group() if m else None
+
 # -------------------------------
 # STAGE 1: INTAKE
 # -------------------------------
@@ -32,10 +67,12 @@ def parse_request_text(state: Dict[str, Any]) -> Dict[str, Any]:
     Extract obvious patterns deterministically (fast-path).
     """
     text = state.get("query", "") or ""
-    order_id_match = re.search(r"#\d+", text)
-    if order_id_match:
-        state["entities"]["order_id"] = order_id_match.group()
+    order_id = _find_order_id(text)
+    if order_id:
+        state["entities"]["order_id"] = order_id
     state["raw_query"] = text
+    # Lowercased once here so later stages don't redo it
+    state["_text_lc"] = text.lower()
     state["parsed_query_tokens"] = text.split()
     return state
 
@@ -45,27 +82,23 @@ def extract_entities(state: Dict[str, Any]) -> Dict[str, Any]:
     ATLAS: Identify product/issue/intent (simulate external system).
     Pragmatic heuristic so the pipeline is fully functional out-of-the-box.
     """
-    text = (state.get("raw_query") or state.get("query") or "").lower()
-    intent = None
-    issue = None
-    product = None
+    text = state.get("_text_lc")
+    if text is None:
+        text = (state.get("raw_query") or state.get("query") or "").lower()
 
-    if "refund" in text:
-        intent = "refund_request"
-    if any(k in text for k in ["delay", "late", "haven't arrived", "hasn’t arrived"]):
-        issue = "delivery_delay"
-    if "invoice" in text:
-        product = "invoice_service"
+    # Single scan over the text for all keywords
+    found = {}
+    for m in _KEYWORD_RE.finditer(text):
+        field, value = _ENTITY_KEYWORDS[m.group()]
+        found[field] = value
 
     # Merge into existing entities (non-destructive)
     ents = state.get("entities", {})
-    if intent: ents["intent"] = intent
-    if issue: ents["issue"] = issue
-    if product: ents["product"] = product
+    ents.update(found)
     state["entities"] = ents
 
     # Lightweight confidence for conditional stages
-    state["confidence"] = 0.9 if any([intent, issue, product]) else 0.5
+    state["confidence"] = 0.9 if found else 0.5
     return state
 
 
@@ -152,9 +185,12 @@ def store_answer(state: Dict[str, Any]) -> Dict[str, Any]:
     STATE MGMT: Fold the answer back into entities.
     """
     ans = state.get("clarification_answer", "")
-    m = re.search(r"#?\d+", ans)
-    if m:
-        state.setdefault("entities", {})["order_id"] = m.group().lstrip("#")
+    # First '#?<digits>' wins. Plain-ASCII answers with no digit and no '#' cannot
+    # match, so they skip the regex ('\d' also matches non-ASCII digits).
+    if "#" in ans or not ans.isascii() or not _ASCII_DIGITS.isdisjoint(ans):
+        m = _ANSWER_ID_RE.search(ans)
+        if m:
+            state.setdefault("entities", {})["order_id"] = m.group().lstrip("#")
     state.setdefault("answers", []).append(ans)
     return state
 
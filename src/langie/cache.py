@@ -0,0 +1,142 @@
+# src/langie/cache.py
+import atexit
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe exact-match LRU cache."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over recent unit-norm query embeddings.
+    A lookup is one matrix-vector product against the stored embeddings;
+    it hits when the best cosine similarity reaches `threshold`.
+    Entries live in a ring buffer, so inserts evict the oldest one.
+    """
+
+    def __init__(self, maxsize: int = 1024, threshold: float = 0.97):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._vecs: Optional[np.ndarray] = None
+        self._values = [None] * maxsize
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def get(self, vec: np.ndarray) -> Optional[Any]:
+        with self._lock:
+            if not self._size:
+                return None
+            sims = self._vecs[:self._size] @ vec
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                return self._values[best]
+            return None
+
+    def put(self, vec: np.ndarray, value: Any):
+        with self._lock:
+            if self._vecs is None:
+                self._vecs = np.zeros((self.maxsize, vec.shape[0]), dtype=np.float32)
+            self._vecs[self._next] = vec
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+
+    def clear(self):
+        with self._lock:
+            self._values = [None] * self.maxsize
+            self._size = 0
+            self._next = 0
+
+
+class EmbeddingCache:
+    """
+    Persistent vector cache (fp16) in a SQLite table, keyed by bytes (e.g. a
+    sha1 digest). WAL mode makes it safe to share between threads, Retrievers
+    and worker processes. Holds at most `maxsize` rows; inserts evict the
+    oldest ones. synchronous=NORMAL syncs only at WAL checkpoints: a power
+    loss can drop the latest entries but does not corrupt the file.
+    """
+
+    def __init__(self, path: str, maxsize: int = 50_000):
+        self.path = path
+        self.maxsize = maxsize
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS emb(key BLOB PRIMARY KEY, vec BLOB NOT NULL)")
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+                chunk = keys[start:start + 500]
+                found.update(self._conn.execute(
+                    f"SELECT key, vec FROM emb WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+        return [
+            np.frombuffer(found[k], dtype=np.float16) if k in found else None for k in keys
+        ]
+
+    def put_many(self, items: Dict[bytes, np.ndarray]):
+        rows = [(k, np.asarray(v, dtype=np.float16).tobytes()) for k, v in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO emb(key, vec) VALUES(?, ?)", rows)
+            # rowids grow with every insert, so this keeps the newest `maxsize` rows
+            self._conn.execute(
+                "DELETE FROM emb WHERE rowid <= (SELECT MAX(rowid) FROM emb) - ?", (self.maxsize,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM emb").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_embedding_caches: Dict[str, EmbeddingCache] = {}
+_embedding_caches_lock = threading.Lock()
+
+
+def get_embedding_cache(path: str, maxsize: int = 50_000) -> EmbeddingCache:
+    """One shared EmbeddingCache (and SQLite handle) per file in this process, closed at exit."""
+    path = os.path.abspath(path)
+    with _embedding_caches_lock:
+        if path not in _embedding_caches:
+            cache = EmbeddingCache(path, maxsize)
+            atexit.register(cache.close)
+            _embedding_caches[path] = cache
+        return _embedding_caches[path]
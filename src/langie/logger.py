@@ -1,5 +1,6 @@
 import logging
 import os
+from logging.handlers import RotatingFileHandler
 
 # Ensure logs/ directory exists
 LOG_DIR = "logs"
@@ -7,6 +8,9 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "pipeline.log")
 
+# Level for the logger and its file handler, e.g. LANGIE_LOG_LEVEL=DEBUG
+LOG_LEVEL = os.getenv("LANGIE_LOG_LEVEL", "INFO").upper()
+
 def get_logger(name="pipeline"):
     """
     Returns a configured logger instance.
@@ -14,16 +18,19 @@ def get_logger(name="pipeline"):
     """
     logger = logging.getLogger(name)
     if not logger.handlers:  # Avoid duplicate handlers
-        logger.setLevel(logging.DEBUG)
+        logger.setLevel(LOG_LEVEL)
 
         # Console handler (INFO and above)
         ch = logging.StreamHandler()
         ch.setLevel(logging.INFO)
         ch.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
 
-        # File handler (DEBUG and above)
-        fh = logging.FileHandler(LOG_FILE, mode="a", encoding="utf-8")
-        fh.setLevel(logging.DEBUG)
+        # File handler (LOG_LEVEL and above); the file is opened on first write
+        fh = RotatingFileHandler(
+            LOG_FILE, mode="a", maxBytes=10 * 1024 * 1024, backupCount=3,
+            encoding="utf-8", delay=True
+        )
+        fh.setLevel(LOG_LEVEL)
         fh.setFormatter(logging.Formatter(
             "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
         ))
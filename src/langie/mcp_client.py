@@ -2,11 +2,11 @@
 import logging
 from typing import Any, Dict
 
-from .retriever import Retriever
+from .retriever import get_retriever
 from . import abilities  # <— use the local ability implementations
 
 logger = logging.getLogger(__name__)
-kb_retriever = Retriever()
+kb_retriever = get_retriever()
 
 class MCPClientError(RuntimeError):
     pass
@@ -1,10 +1,11 @@
-from pydantic import BaseModel, Field
 from typing import Optional
 
-class InputPayload(BaseModel):
+import msgspec
+
+class InputPayload(msgspec.Struct):
     """Schema for incoming customer support request."""
     customer_name: str
     email: str
     query: str
-    priority: Optional[str] = Field(default="Normal")
+    priority: Optional[str] = "Normal"
     ticket_id: Optional[str] = None
@@ -1,15 +1,18 @@
+import functools
+import logging
+import msgspec
 import yaml
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any, Callable, Dict, List, Tuple
 from .logger import get_logger
 from .mcp_client import call_common, call_atlas
 from .models import InputPayload
-from .retriever import Retriever
+from .retriever import get_retriever
 
 logger = get_logger(__name__)
 
 # Global KB retriever instance
-kb_retriever = Retriever()
+kb_retriever = get_retriever()
 
 class LangGraphAgent:
     """
@@ -22,12 +25,13 @@ class LangGraphAgent:
         self.config_path = config_path
         self.config = yaml.safe_load(Path(config_path).read_text())
         self.state: Dict[str, Any] = {"logs": []}
+        self._plan = self._compile(self.config.get("stages", []))
         logger.info("⚙️ Loaded pipeline config from %s", config_path)
 
     def validate_input(self, payload: Dict[str, Any]) -> Dict[str, Any]:
         """Validate input payload against schema."""
-        validated = InputPayload.model_validate(payload)
-        return validated.model_dump()
+        validated = msgspec.convert(payload, InputPayload)
+        return msgspec.structs.asdict(validated)
 
     def run(self, input_payload: Dict[str, Any]) -> Dict[str, Any]:
         """Run the end-to-end pipeline for a given payload."""
@@ -41,73 +45,107 @@ class LangGraphAgent:
             "input_summary": {k: self.state.get(k) for k in ['ticket_id', 'customer_name']}
         })
 
-        for stage in self.config.get("stages", []):
+        for stage_start, stage_end, step in self._plan:
+            self._log("stage_start", stage_start)
+            step()
+            self._log("stage_end", stage_end)
+
+        self._log("run_completed", {"final_keys": list(self.state.keys())})
+        return self.state
+
+    def _compile(self, stages) -> List[Tuple[Dict[str, Any], Dict[str, Any], Callable[[], None]]]:
+        """
+        Translate the YAML stages into a flat plan of (stage_start payload,
+        stage_end payload, step) built once, so run() does no config lookups,
+        mode branching or ability-name matching per request.
+        """
+        plan = []
+        for stage in stages:
             name = stage["name"]
             mode = stage.get("mode", "deterministic")
-            self._log("stage_start", {"stage": name, "mode": mode})
+            abilities = stage.get("abilities", [])
+            calls = [self._bind_ability(name, ability) for ability in abilities]
 
             if mode == "deterministic":
-                for ability in stage.get("abilities", []):
-                    self._execute_ability(name, ability)
+                step = self._sequence(calls)
 
             elif mode == "conditional":
                 cond = stage.get("condition", "")
-                if self._eval_condition(cond):
-                    for ability in stage.get("abilities", []):
-                        self._execute_ability(name, ability)
-                else:
-                    logger.info("⏩ Skipping conditional stage %s (cond=%s)", name, cond)
+                run_stage = self._sequence(calls)
+
+                def step(name=name, cond=cond, run_stage=run_stage):
+                    if self._eval_condition(cond):
+                        run_stage()
+                    else:
+                        logger.info("⏩ Skipping conditional stage %s (cond=%s)", name, cond)
 
             elif mode == "non-deterministic":
-                # Run evaluation first
-                for ability in stage.get("abilities", []):
-                    if ability["name"] == "solution_evaluation":
-                        self._execute_ability(name, ability)
-                        break
-                score = self.state.get("solution_score", 0)
-
-                # Escalation if score < threshold
-                if score < 90:
-                    for ability in stage.get("abilities", []):
-                        if ability["name"] == "escalation_decision":
-                            self._execute_ability(name, ability)
-
-                # Always update payload if configured
-                for ability in stage.get("abilities", []):
-                    if ability["name"] == "update_payload":
-                        self._execute_ability(name, ability)
+                by_name = {}
+                for ability, call in zip(abilities, calls):
+                    by_name.setdefault(ability["name"], []).append(call)
+                # The first evaluation runs; every listed escalation / update does
+                evaluate = by_name.get("solution_evaluation", [])[:1]
+                escalate = self._sequence(by_name.get("escalation_decision", []))
+                update = self._sequence(by_name.get("update_payload", []))
+
+                def step(evaluate=evaluate, escalate=escalate, update=update):
+                    # Run evaluation first
+                    for call in evaluate:
+                        call()
+                    # Escalation if score < threshold
+                    if self.state.get("solution_score", 0) < 90:
+                        escalate()
+                    # Always update payload if configured
+                    update()
 
             else:
                 logger.warning("⚠️ Unknown stage mode %s for stage %s", mode, name)
+                step = self._sequence([])
 
-            self._log("stage_end", {"stage": name})
+            plan.append(({"stage": name, "mode": mode}, {"stage": name}, step))
+        return plan
 
-        self._log("run_completed", {"final_keys": list(self.state.keys())})
-        return self.state
+    @staticmethod
+    def _sequence(calls: List[Callable[[], Any]]) -> Callable[[], None]:
+        def step():
+            for call in calls:
+                call()
+        return step
 
-    def _execute_ability(self, stage_name: str, ability: Dict[str, Any]) -> Any:
-        """Execute an ability via MCP client (COMMON or ATLAS)."""
+    def _bind_ability(self, stage_name: str, ability: Dict[str, Any]) -> Callable[[], Any]:
+        """Resolve an ability's route once; the returned callable runs it on self.state."""
         name = ability["name"]
         server = ability.get("server", "COMMON")
-        self._log("ability_start", {"stage": stage_name, "ability": name, "server": server})
+        if name == "knowledge_base_search":
+            call = self._kb_search
+        elif server.upper() == "ATLAS":
+            call = functools.partial(call_atlas, name)
+        else:
+            call = functools.partial(call_common, name)
+        return functools.partial(self._execute_ability, stage_name, name, server, call)
+
+    def _kb_search(self, state: Dict[str, Any]) -> Any:
+        kb_results = kb_retriever.search(state.get("query", ""))
+        state["kb_results"] = kb_results
+        return kb_results
+
+    def _execute_ability(self, stage_name: str, name: str, server: str,
+                         call: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Execute an ability via MCP client (COMMON or ATLAS)."""
+        if logger.isEnabledFor(logging.DEBUG):
+            self._log("ability_start", {"stage": stage_name, "ability": name, "server": server},
+                      level=logging.DEBUG)
 
         try:
-            if name == "knowledge_base_search":
-                query = self.state.get("query", "")
-                kb_results = kb_retriever.search(query)
-                self.state["kb_results"] = kb_results
-                result = kb_results
-            else:
-                if server.upper() == "ATLAS":
-                    result = call_atlas(name, self.state)
-                else:
-                    result = call_common(name, self.state)
+            result = call(self.state)
         except Exception as e:
             logger.exception("❌ Ability %s failed in stage %s", name, stage_name)
             result = {"error": str(e)}
 
-        # merge results into state
-        if isinstance(result, dict):
+        # merge results into state (abilities that mutate and return the state need no merge)
+        if result is self.state:
+            pass
+        elif isinstance(result, dict):
             for k, v in result.items():
                 if k in self.state and isinstance(self.state[k], dict) and isinstance(v, dict):
                     self.state[k].update(v)  # deep merge
@@ -116,11 +154,12 @@ class LangGraphAgent:
         else:
             self.state[f"{stage_name}_{name}"] = result or "done"
 
-        self._log("ability_end", {
-            "stage": stage_name,
-            "ability": name,
-            "result_summary": self._summarize(result)
-        })
+        if logger.isEnabledFor(logging.DEBUG):
+            self._log("ability_end", {
+                "stage": stage_name,
+                "ability": name,
+                "result_summary": self._summarize(result)
+            }, level=logging.DEBUG)
         return result
 
     def _eval_condition(self, cond: str) -> bool:
@@ -137,10 +176,11 @@ class LangGraphAgent:
             return False
         return False
 
-    def _log(self, event: str, payload: Dict[str, Any]):
-        """Log structured event to both state and logger."""
-        logger.info("%s %s", event, payload)
-        self.state.setdefault("logs", []).append({"event": event, "payload": payload})
+    def _log(self, event: str, payload: Dict[str, Any], level: int = logging.INFO):
+        """Log structured event to the logger, and to state["logs"] when DEBUG is enabled."""
+        logger.log(level, "%s %s", event, payload)
+        if logger.isEnabledFor(logging.DEBUG):
+            self.state.setdefault("logs", []).append({"event": event, "payload": payload})
 
     def _summarize(self, result: Any):
         """Summarize results to avoid bloating logs."""
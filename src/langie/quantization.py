@@ -0,0 +1,358 @@
+# src/langie/quantization.py
+import contextlib
+import io
+import json
+import os
+from typing import List, Tuple
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; numpy kernels are used instead
+    njit = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock; saves are still atomic
+    fcntl = None
+
+INDEX_DIR = "data/kb_index"
+
+# The sign-bit (binary) prefilter keeps candidates * BINARY_OVERSAMPLE rows for SQ8
+# scoring, and only runs when the index has more rows than that
+BINARY_OVERSAMPLE = 16
+
+# Set bits per byte value, for numpy < 2.0 (no np.bitwise_count)
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _int8_dot_numpy(codes: np.ndarray, qcodes: np.ndarray) -> np.ndarray:
+    return codes.astype(np.int32) @ qcodes.astype(np.int32)
+
+
+if njit is not None:
+    # Serial kernels: they are called from worker threads, and numba's parallel
+    # (TBB) layer keeps the process from exiting; one core scans a shortlist fine
+    @njit(cache=True)
+    def _int8_dot_numba(codes, qcodes):
+        # int8 x int8 products accumulated in int32; LLVM vectorizes the inner loop
+        n, d = codes.shape
+        out = np.empty(n, dtype=np.int32)
+        for i in range(n):
+            acc = np.int32(0)
+            for j in range(d):
+                acc += np.int32(codes[i, j]) * np.int32(qcodes[j])
+            out[i] = acc
+        return out
+
+    int8_dot = _int8_dot_numba
+else:
+    int8_dot = _int8_dot_numpy
+
+# float16 bit pattern -> float32 value; numba has no float16 arrays, so the
+# rerank kernel reads fp16 rows as uint16 and decodes through this table
+_HALF_TO_FLOAT = np.arange(65536, dtype=np.uint16).view(np.float16).astype(np.float32)
+
+if njit is not None:
+    @njit(fastmath=True, cache=True)
+    def _rerank_f16_numba(query, half_bits, lut, rows, out):
+        # Gathers each shortlisted row straight from the (memmapped) matrix, no temporary copy
+        for i in range(rows.shape[0]):
+            row = rows[i]
+            acc = np.float32(0.0)
+            for d in range(query.shape[0]):
+                acc += lut[half_bits[row, d]] * query[d]
+            out[i] = acc
+
+
+def rerank(vectors: np.ndarray, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """float32 dot products of `query` with vectors[rows] (fp16 or fp32 rows)."""
+    if njit is not None and vectors.dtype == np.float16:
+        out = np.empty(len(rows), dtype=np.float32)
+        _rerank_f16_numba(query, vectors.view(np.uint16), _HALF_TO_FLOAT, rows, out)
+        return out
+    return np.asarray(vectors[rows], dtype=np.float32) @ query
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (or a single vector) as float32."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def pack_signs(vectors: np.ndarray) -> np.ndarray:
+    """Binary-quantize: one bit per dimension (v > 0), packed along the last axis."""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+def hamming(bits: np.ndarray, qbits: np.ndarray) -> np.ndarray:
+    """Hamming distance from packed query bits to every packed row."""
+    if bits.shape[1] % 8 == 0 and bits.flags.c_contiguous:
+        # 8 bytes at a time: 384 dims = 6 uint64 popcounts per row
+        bits, qbits = bits.view(np.uint64), np.ascontiguousarray(qbits).view(np.uint64)
+    diff = np.bitwise_xor(bits, qbits)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=1)
+    return _POPCOUNT8[diff.view(np.uint8)].sum(axis=1)
+
+
+class SQ8Codec:
+    """
+    Symmetric per-dimension scalar quantization to int8 (SQ8).
+    Each dimension d is stored as round(v[d] / scale[d]) in [-127, 127].
+    """
+
+    def __init__(self, scale: np.ndarray = None):
+        self.scale = scale
+
+    def fit(self, vectors: np.ndarray) -> "SQ8Codec":
+        self.scale = (np.abs(vectors).max(axis=0) / 127.0).astype(np.float32)
+        self.scale = np.clip(self.scale, 1e-12, None)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def encode_query(self, query: np.ndarray):
+        """
+        Quantize a query for integer scoring. Since v[d] ~= code[d] * scale[d],
+        v . q = sum(code[d] * (scale[d] * q[d])); the weighted query scale * q is
+        quantized to int8 with one scalar step so the sum is a pure int8 dot.
+        """
+        weighted = query * self.scale
+        step = max(float(np.abs(weighted).max()) / 127.0, 1e-12)
+        qcodes = np.clip(np.rint(weighted / step), -127, 127).astype(np.int8)
+        return qcodes, step
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate dot products of a float query with every coded vector."""
+        qcodes, step = self.encode_query(query)
+        return int8_dot(codes, qcodes).astype(np.float32) * step
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _save_atomic(path: str, array: np.ndarray):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:  # a file object, so np.save does not append ".npy"
+        np.save(f, np.asarray(array))
+    os.replace(tmp, path)
+
+
+def _append_rows(path: str, rows: np.ndarray, n: int):
+    """
+    Write `rows` after the first n rows of the .npy file at `path` and update
+    its header in place: O(len(rows)) I/O, and the file never shrinks, so
+    memory-mapped readers stay valid. Falls back to an atomic rewrite when the
+    header has no room for the new shape.
+    """
+    with open(path, "r+b") as f:
+        version = np.lib.format.read_magic(f)
+        read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                       else np.lib.format.read_array_header_2_0)
+        shape, fortran_order, dtype = read_header(f)
+        data_start = f.tell()
+        if shape[0] < n or fortran_order:
+            raise ValueError(f"{path} holds {shape[0]} rows, expected at least {n}")
+        rows = np.ascontiguousarray(rows, dtype=dtype)
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            "descr": np.lib.format.dtype_to_descr(dtype),
+            "fortran_order": False,
+            "shape": (n + len(rows),) + tuple(shape[1:]),
+        })
+        in_place = version == (1, 0) and len(header.getvalue()) == data_start
+        if in_place:
+            # Rows past n are left over from an interrupted append; overwrite them
+            f.seek(data_start + n * dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64)))
+            f.write(rows.tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header.getvalue())  # after the data, so the header never counts missing rows
+    if not in_place:
+        _save_atomic(path, np.concatenate([np.load(path)[:n], rows]))
+
+
+@contextlib.contextmanager
+def index_lock(path: str = INDEX_DIR, shared: bool = False):
+    """
+    Cross-process lock on the index at `path` (flock on path/.lock): exclusive
+    for writers, shared for load(), so a reader never sees a half-written index.
+    """
+    if fcntl is None:
+        yield
+        return
+    try:
+        f = open(os.path.join(path, ".lock"), "a")
+    except OSError:  # e.g. a read-only index directory: nobody writes it
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        yield  # closing the file releases the lock
+
+
+def index_version(path: str = INDEX_DIR):
+    """Identity of the saved index (inode, mtime) or None; changes on every save()."""
+    try:
+        st = os.stat(os.path.join(path, "index.json"))
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _write_meta(path: str, ids: List[str], space: str):
+    tmp = os.path.join(path, "index.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"ids": ids, "space": space}, f)
+    os.replace(tmp, os.path.join(path, "index.json"))
+
+
+class QuantizedIndex:
+    """
+    Brute-force SQ8 index kept next to the Chroma collection (Chroma has no
+    native scalar quantization). On larger indexes a Hamming pass over
+    sign bits (48 bytes per 384-d vector) first narrows the rows to score;
+    candidates are then shortlisted on the int8 codes and reranked with
+    fp16 copies of the vectors (half the bytes of fp32, ample precision for
+    ranking unit vectors), which are memory-mapped so only the shortlisted
+    rows are read.
+
+    Files under `path`: index.json (ids + distance space), sq8_codes.npy,
+    sq8_scale.npy, sign_bits.npy, vectors_f16.npy.
+    """
+
+    def __init__(self, ids: List[str], codes: np.ndarray, codec: SQ8Codec,
+                 space: str = "l2", vectors: np.ndarray = None, bits: np.ndarray = None):
+        self.ids = ids
+        self.codes = codes
+        self.codec = codec
+        self.space = space
+        self.vectors = vectors
+        self.bits = bits
+
+    @classmethod
+    def build(cls, ids: List[str], vectors: np.ndarray, space: str = "l2") -> "QuantizedIndex":
+        vectors = normalize(vectors)
+        codec = SQ8Codec().fit(vectors)
+        return cls(list(ids), codec.encode(vectors), codec, space,
+                   vectors.astype(np.float16), pack_signs(vectors))
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        """Append vectors, encoded with the existing scales (no refit, so old codes stay valid)."""
+        vectors = normalize(np.atleast_2d(vectors))
+        self.ids.extend(ids)
+        self.codes = np.vstack([self.codes, self.codec.encode(vectors)])
+        if self.vectors is not None:
+            self.vectors = np.vstack([np.asarray(self.vectors, dtype=np.float16), vectors.astype(np.float16)])
+        if self.bits is not None:
+            self.bits = np.vstack([self.bits, pack_signs(vectors)])
+
+    def save(self, path: str = INDEX_DIR):
+        """
+        Write each file under a temporary name and os.replace() it, index.json
+        last, holding the writers' lock. Processes that memory-mapped the old
+        vectors keep reading the old inode instead of a file being truncated
+        under them.
+        """
+        os.makedirs(path, exist_ok=True)
+        with index_lock(path):
+            _save_atomic(os.path.join(path, "sq8_codes.npy"), self.codes)
+            _save_atomic(os.path.join(path, "sq8_scale.npy"), self.codec.scale)
+            if self.bits is not None:
+                _save_atomic(os.path.join(path, "sign_bits.npy"), self.bits)
+            if self.vectors is not None:
+                _save_atomic(os.path.join(path, "vectors_f16.npy"), self.vectors)
+            _write_meta(path, self.ids, self.space)
+
+    @classmethod
+    def append(cls, path: str, ids: List[str], vectors: np.ndarray) -> bool:
+        """
+        Add rows to the index saved at `path` without loading or rewriting it:
+        under the writers' lock, encode them with the saved scales, append them
+        to each array file in place and replace index.json last. Concurrent
+        adders (threads or processes) are serialized, so none is lost.
+        Returns False if there is no saved index.
+        """
+        with index_lock(path):
+            try:
+                with open(os.path.join(path, "index.json"), "r") as f:
+                    meta = json.load(f)
+            except FileNotFoundError:
+                return False
+            n = len(meta["ids"])
+            vectors = normalize(np.atleast_2d(vectors))
+            codec = SQ8Codec(np.load(os.path.join(path, "sq8_scale.npy")))
+            _append_rows(os.path.join(path, "sq8_codes.npy"), codec.encode(vectors), n)
+            bits_path = os.path.join(path, "sign_bits.npy")
+            if os.path.exists(bits_path):
+                _append_rows(bits_path, pack_signs(vectors), n)
+            for name in ("vectors_f16.npy", "vectors_f32.npy"):
+                vectors_path = os.path.join(path, name)
+                if os.path.exists(vectors_path):
+                    _append_rows(vectors_path, vectors, n)  # cast to the file's dtype
+                    break
+            _write_meta(path, meta["ids"] + list(ids), meta.get("space", "l2"))
+        return True
+
+    @classmethod
+    def load(cls, path: str = INDEX_DIR) -> "QuantizedIndex":
+        with index_lock(path, shared=True):
+            with open(os.path.join(path, "index.json"), "r") as f:
+                meta = json.load(f)
+            codes = np.load(os.path.join(path, "sq8_codes.npy"))
+            codec = SQ8Codec(np.load(os.path.join(path, "sq8_scale.npy")))
+            vectors = None
+            for name in ("vectors_f16.npy", "vectors_f32.npy"):  # f32: written by older ingests
+                vectors_path = os.path.join(path, name)
+                if os.path.exists(vectors_path):
+                    vectors = np.load(vectors_path, mmap_mode="r")
+                    break
+            bits_path = os.path.join(path, "sign_bits.npy")
+            bits = np.load(bits_path) if os.path.exists(bits_path) else None
+        # index.json has the row count; rows past it are left over from an interrupted append
+        n = len(meta["ids"])
+        if any(a is not None and len(a) < n for a in (codes, vectors, bits)):
+            raise ValueError(f"Index at {path} has fewer rows than ids")
+        codes, vectors, bits = (a if a is None else a[:n] for a in (codes, vectors, bits))
+        return cls(meta["ids"], codes, codec, meta.get("space", "l2"), vectors, bits)
+
+    def search(self, query: np.ndarray, k: int, candidates: int = None) -> List[Tuple[str, float]]:
+        """
+        Return up to k (id, similarity) pairs, best first. Shortlists
+        `candidates` rows (default k) on the int8 codes, after a sign-bit
+        Hamming prefilter when the index is large enough; if the fp16 vectors
+        are available the shortlist is rescored with them.
+        """
+        query = normalize(query)
+        shortlist = max(candidates or k, k)
+        if self.bits is not None and len(self.ids) > shortlist * BINARY_OVERSAMPLE:
+            dist = hamming(self.bits, pack_signs(query)).astype(np.int32)
+            coarse = _top(-dist, shortlist * BINARY_OVERSAMPLE)
+            coarse.sort()
+            approx = self.codec.score(self.codes[coarse], query)
+            rows = coarse[_top(approx, shortlist)]
+        else:
+            approx = self.codec.score(self.codes, query)
+            rows = _top(approx, shortlist)
+        if self.vectors is None:
+            approx = self.codec.score(self.codes[rows[:k]], query)
+            return [(self.ids[i], float(s)) for i, s in zip(rows[:k], approx)]
+        rows = np.sort(rows)  # ascending gather reads the memmap sequentially
+        exact = rerank(self.vectors, rows, query)
+        return [(self.ids[rows[i]], float(exact[i])) for i in _top(exact, k)]
+
+    def distance(self, similarity: float) -> float:
+        """Map cosine similarity of unit vectors onto the collection's distance."""
+        if self.space == "l2":
+            return 2.0 - 2.0 * similarity  # squared L2, as Chroma reports it
+        return 1.0 - similarity
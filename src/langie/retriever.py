@@ -1,57 +1,510 @@
 # src/langie/retriever.py
+import collections
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+# CPU threads for inference; OpenMP reads this when torch/numpy load, so set it first
+NUM_THREADS = int(os.getenv("LANGIE_TORCH_THREADS", os.cpu_count() or 1))
+os.environ.setdefault("OMP_NUM_THREADS", str(NUM_THREADS))
+
 import chromadb
+import numpy as np
+import torch
 from chromadb.api.types import EmbeddingFunction
 from sentence_transformers import SentenceTransformer
 
+from .cache import SemanticCache, get_embedding_cache
+from .logger import get_logger
+from .quantization import INDEX_DIR, QuantizedIndex, index_version, normalize
+
+logger = get_logger(__name__)
+
+# Inference only: use every core for intra-op matmuls and never track gradients
+torch.set_num_threads(NUM_THREADS)
+try:
+    torch.set_num_interop_threads(2)
+except RuntimeError:
+    pass  # only settable before torch runs parallel work; keep the existing value
+torch.set_grad_enabled(False)
+
+# Embedding backend: "onnx", "sbert", or "auto" (ONNX when the export below exists)
+EMBED_BACKEND = os.getenv("LANGIE_EMBED_BACKEND", "auto").lower()
+
+# INT8 ONNX export of all-MiniLM-L6-v2 (built by scripts/export_onnx.py)
+ONNX_MODEL_DIR = os.getenv("LANGIE_ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2-int8")
+ONNX_MODEL_FILE = "model_quantized.onnx"
+
+# FAQ source read by scripts/kb_ingest.py: JSON Lines, one record per line, append-only
+KB_PATH = "data/kb_faq.jsonl"
+
+# Near-duplicate queries (cosine >= threshold) reuse the hits of a recent query
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_THRESHOLD = 0.97
+
+# Query embeddings kept on disk across runs and processes (fp16); 0 disables
+EMBED_CACHE_SIZE = int(os.getenv("LANGIE_EMBED_CACHE_SIZE", "50000"))
+EMBED_CACHE_FILE = "query_emb_cache.sqlite3"
+
+# Texts per forward pass when encoding
+ENCODE_BATCH_SIZE = 64
+
+# HNSW settings for the FAQ collection. Embeddings are stored and queried unit-norm,
+# so cosine distance (1 - dot) needs no per-pair norms/sqrt, and cosine is SBERT's
+# native metric. M / construction_ef trade build time + memory for recall; search_ef
+# trades query latency for recall (64 is ample for a small FAQ set).
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
+
+
+@functools.lru_cache(maxsize=4)
+def _get_model(model_name: str) -> SentenceTransformer:
+    """Load each SentenceTransformer once per process; encode() is safe to share."""
+    return SentenceTransformer(model_name)
+
 
 class SentenceTransformerEmbeddingFunction(EmbeddingFunction):
     def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+        self.model = _get_model(model_name)
+
+    def __call__(self, input):
+        # input is a list[str]; returns an (N, dim) float32 array (no per-float boxing),
+        # unit-norm so inner-product search is cosine.
+        # encode() length-sorts internally, so each sub-batch of batch_size pads little.
+        with torch.inference_mode():
+            return self.model.encode(
+                input,
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False,
+            ).astype(np.float32, copy=False)
+
+
+class ONNXMiniLMEF(EmbeddingFunction):
+    """
+    all-MiniLM-L6-v2 served by ONNX Runtime from a dynamically quantized
+    (INT8) export. Mirrors the SentenceTransformer pipeline: tokenize,
+    transformer forward, mean-pool over the attention mask, L2-normalize.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        so = ort.SessionOptions()
+        so.intra_op_num_threads = os.cpu_count() or 1
+        # Constant folding plus LayerNorm/GELU/attention fusions
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            sess_options=so,
+            providers=["CPUExecutionProvider"],
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        self.input_names = {i.name for i in self.session.get_inputs()}
 
     def __call__(self, input):
-        # input is a list[str]
-        return self.model.encode(input).tolist()
+        # input is a list[str]. Smart batching: encode length-sorted sub-batches so
+        # padding stays close to each batch's own longest text, then restore order.
+        texts = list(input)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = None
+        for start in range(0, len(order), ENCODE_BATCH_SIZE):
+            idx = order[start:start + ENCODE_BATCH_SIZE]
+            embs = self._encode([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), embs.shape[1]), dtype=np.float32)
+            out[idx] = embs
+        return np.empty((0, 0), dtype=np.float32) if out is None else out
+
+    def _encode(self, texts):
+        enc = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=256, return_tensors="np"
+        )
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        token_embs = self.session.run(None, feeds)[0]
+
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embs * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+def _question(doc: str) -> str:
+    """The question of a "Q: ...\nA: ..." FAQ document."""
+    if doc.startswith("Q: "):
+        return doc[3:].partition("\nA: ")[0]
+    return doc
+
+
+def load_faqs(path: str = KB_PATH):
+    """Stream FAQ records ({"id", "question", "answer"}) from the JSONL source."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def get_embedding_function(backend: str = EMBED_BACKEND):
+    """
+    Embedding function for `backend`: "onnx" (INT8 ONNX Runtime), "sbert"
+    (SentenceTransformers), or "auto" (ONNX if it has been exported).
+    """
+    if backend == "auto":
+        exported = os.path.exists(os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE))
+        backend = "onnx" if exported else "sbert"
+    if backend == "onnx":
+        return ONNXMiniLMEF()
+    if backend == "sbert":
+        return SentenceTransformerEmbeddingFunction()
+    raise ValueError(f"Unknown embedding backend: {backend!r}")
 
 
 class Retriever:
-    def __init__(self, db_path: str = "data/chroma", collection_name: str = "faq"):
+    def __init__(self, db_path: str = "data/chroma", collection_name: str = "faq",
+                 quantized: bool = False, index_dir: str = INDEX_DIR, oversample: int = 8):
         """
         Retriever for ChromaDB-based FAQ Knowledge Base.
         
         Args:
             db_path (str): Path where ChromaDB is persisted.
             collection_name (str): Name of the collection to use.
+            quantized (bool): Shortlist with the SQ8 sidecar index written by
+                kb_ingest.py, then rerank with its fp16 vectors.
+            index_dir (str): Where the SQ8 sidecar index lives.
+            oversample (int): Shortlist top_k * oversample candidates on the
+                int8 codes before the fp16 rerank.
         """
         self.db_path = db_path
         self.collection_name = collection_name
+        self.index_dir = index_dir
+        self.quantized = quantized
+        self.oversample = oversample
+        self._write_lock = threading.Lock()
+        self._semantic_cache = SemanticCache(SEMANTIC_CACHE_SIZE, SEMANTIC_THRESHOLD)
+        self._cache_version = None
 
         # Load persisted Chroma
         self.client = chromadb.PersistentClient(path=self.db_path)
 
-        # Pass in wrapper embedding function
+        # Pass in wrapper embedding function (ONNX INT8 if exported)
+        self.embedding_function = get_embedding_function()
         self.collection = self.client.get_or_create_collection(
             name=self.collection_name,
-            embedding_function=SentenceTransformerEmbeddingFunction()
+            embedding_function=self.embedding_function,
+            metadata=COLLECTION_METADATA
         )
-    def search(self, query: str, top_k: int = 3):
-        """Search FAQ KB using local embeddings + ChromaDB."""
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k
+
+        # Query embeddings persisted across runs (fp16), keyed by sha1 of backend + text;
+        # one SQLite handle per file, shared by every Retriever in the process.
+        # Best effort: if the file cannot be used, queries are simply encoded.
+        self._emb_cache = None
+        if EMBED_CACHE_SIZE > 0:
+            try:
+                self._emb_cache = get_embedding_cache(
+                    os.path.join(self.db_path, EMBED_CACHE_FILE), EMBED_CACHE_SIZE
+                )
+            except sqlite3.Error:
+                logger.exception("Query-embedding cache unavailable; encoding every query")
+        self._emb_cache_ns = type(self.embedding_function).__name__
+
+        # Optional SQ8 sidecar index (falls back to HNSW if it was never built);
+        # reloaded when another Retriever or process saves a new one
+        self.index = None
+        self._index_version = None
+        if quantized:
+            self._reload_index()
+
+    def refresh(self):
+        """
+        Pick up a rebuilt knowledge base: re-open the collection (it may have been
+        dropped and recreated), reload the SQ8 sidecar and drop cached hits.
+        """
+        with self._write_lock:
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_function,
+                metadata=COLLECTION_METADATA
+            )
+            self.index = None
+            self._index_version = None
+            if self.quantized:
+                self._reload_index()
+            self.clear_cache()
+
+    def _reload_index(self) -> bool:
+        """Load the sidecar if it changed on disk since it was last loaded; True if it did."""
+        version = index_version(self.index_dir)
+        if version is None or version == self._index_version:
+            return False
+        try:
+            self.index = QuantizedIndex.load(self.index_dir)
+        except (OSError, ValueError):
+            return False  # mid-save; keep the current index and retry on the next search
+        self._index_version = version
+        return True
+
+    def add_faq(self, question: str, answer: str, kb_path: str = KB_PATH) -> str:
+        """
+        Add one FAQ without rebuilding the KB: append one line to the JSONL
+        source, embed just that entry and upsert it, and append it to the SQ8
+        sidecar. The random id is both the JSONL record id and the Chroma id
+        (kb_ingest.py uses record ids), so concurrent adders never collide.
+        Returns the id.
+        """
+        question, answer = question.strip(), answer.strip()
+        doc_id = f"faq_{uuid.uuid4().hex}"
+        with self._write_lock:
+            record = {"id": doc_id, "question": question, "answer": answer}
+            with open(kb_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            vec = self._upsert([record])
+
+            # Keep the sidecar in sync even if this Retriever does not search with it.
+            # append() holds a cross-process lock and writes only the new row. Chroma
+            # and the JSONL already have the FAQ, so a failure here is logged, not raised.
+            try:
+                QuantizedIndex.append(self.index_dir, [doc_id], vec)
+            except Exception:
+                logger.exception(
+                    "FAQ %s is in Chroma but not in the SQ8 sidecar; run scripts/kb_ingest.py", doc_id
+                )
+            if self.quantized:
+                self._reload_index()
+            self.clear_cache()
+        return doc_id
+
+    def bulk_upsert(self, records, batch: int = 1024) -> np.ndarray:
+        """
+        Embed and upsert FAQ records ({"id", "question", "answer"}) `batch` at a
+        time: one batched encode and one Chroma upsert per chunk instead of one
+        per record. Returns the unit-norm embeddings in record order.
+        """
+        records = list(records)
+        embeddings = None
+        with self._write_lock:
+            for start in range(0, len(records), batch):
+                embs = self._upsert(records[start:start + batch])
+                if embeddings is None:
+                    embeddings = np.empty((len(records), embs.shape[1]), dtype=np.float32)
+                embeddings[start:start + len(embs)] = embs
+            self.clear_cache()
+        if embeddings is None:
+            return np.empty((0, 0), dtype=np.float32)
+        return embeddings
+
+    def _upsert(self, records) -> np.ndarray:
+        # Document "Q: ...\nA: ..." (Q and A are embedded together) is the only copy of
+        # the question; metadata holds just the answer. None drops the "question" key
+        # that older ingests stored, since upsert merges metadata.
+        questions = [r["question"].strip() for r in records]
+        answers = [r["answer"].strip() for r in records]
+        docs = [f"Q: {q}\nA: {a}" for q, a in zip(questions, answers)]
+        embs = normalize(self.embedding_function(docs))
+        self.collection.upsert(
+            ids=[r["id"] for r in records],
+            documents=docs,
+            metadatas=[{"answer": a, "question": None} for a in answers],
+            embeddings=embs
         )
+        return embs
+
+    @property
+    def space(self) -> str:
+        """Distance space of the scores this Retriever returns ("cosine" or "l2")."""
+        if self.index is not None:
+            return self.index.space
+        return (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def kb_version(self):
+        """
+        Changes whenever the KB behind this Retriever may have changed: an add,
+        bulk upsert or refresh through any Retriever on the collection in this
+        process, or (quantized) a newer sidecar saved by another process.
+        Result caches outside the Retriever key their entries on it.
+        """
+        if self.quantized:
+            self._reload_index()  # one stat() unless the sidecar changed
+        return _kb_versions[(self.db_path, self.collection_name)], self._index_version
+
+    def clear_cache(self):
+        """
+        Drop cached hits, e.g. after the collection changed. Also bumps the KB
+        version, so every Retriever and result cache on the collection drops its own.
+        """
+        with _kb_versions_lock:
+            _kb_versions[(self.db_path, self.collection_name)] += 1
+        self._semantic_cache.clear()
+
+    def search(self, query: str, top_k: int = 3, return_arrays: bool = False):
+        """
+        Search FAQ KB using local embeddings + ChromaDB.
+        With return_arrays=True, returns (hits, scores): the hit dicts plus their
+        distances as one float32 array, for vectorized thresholding (scores < t).
+        """
+        hits = self.search_embeddings(self.embed([query]), top_k)[0]
+        if not return_arrays:
+            return hits
+        return hits, np.fromiter((h["score"] for h in hits), dtype=np.float32, count=len(hits))
+
+    def search_many(self, queries, top_k: int = 3):
+        """Search several queries with one batched encode + Chroma query."""
+        if not queries:
+            return []
+        return self.search_embeddings(self.embed(queries), top_k)
+
+    def embed(self, queries) -> np.ndarray:
+        """
+        Encode queries into unit-norm float32 vectors (one row per query).
+        Previously seen queries come from the on-disk embedding cache; only
+        the misses go through the model.
+        """
+        queries = list(queries)
+        if not queries:
+            return np.empty((0, 0), dtype=np.float32)
+        cache = self._emb_cache
+        if cache is None:
+            return normalize(self.embedding_function(queries))
+        keys = [
+            hashlib.sha1(f"{self._emb_cache_ns}\0{q}".encode("utf-8")).digest()
+            for q in queries
+        ]
+        try:
+            cached = cache.get_many(keys)
+        except sqlite3.Error:
+            self._disable_emb_cache()
+            return normalize(self.embedding_function(queries))
+        misses = [i for i, vec in enumerate(cached) if vec is None]
+        if misses:
+            fresh = self.embedding_function([queries[i] for i in misses])
+            for i, vec in zip(misses, fresh):
+                cached[i] = vec
+            try:
+                cache.put_many({keys[i]: cached[i] for i in misses})
+            except sqlite3.Error:
+                self._disable_emb_cache()
+        return normalize(np.stack(cached))
+
+    def _disable_emb_cache(self):
+        # e.g. a corrupt or unwritable file: searches keep working without the cache
+        logger.exception("Query-embedding cache failed; disabling it for this Retriever")
+        self._emb_cache = None
+
+    def search_embeddings(self, query_vecs: np.ndarray, top_k: int = 3):
+        """
+        Like search_many(), for queries that were already embedded via embed().
+        Queries within SEMANTIC_THRESHOLD cosine of a recent one reuse its hits
+        (one matrix-vector product) instead of searching the index again.
+        """
+        # Picks up FAQs added through other Retrievers or processes; entries are also
+        # tagged with the version, so a search racing a change cannot be served later
+        version = self.kb_version()
+        if version != self._cache_version:
+            self._semantic_cache.clear()
+            self._cache_version = version
+
+        results = [None] * len(query_vecs)
+        misses = []
+        for i, qv in enumerate(query_vecs):
+            cached = self._semantic_cache.get(qv)
+            if cached is not None and cached[:2] == (top_k, version):
+                results[i] = cached[2]
+            else:
+                misses.append(i)
+        if not misses:
+            return results
+
+        if self.index is not None:
+            fresh = self._search_quantized(query_vecs[misses], top_k)
+        else:
+            found = self.collection.query(
+                query_embeddings=query_vecs[misses],
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"]  # never ship embeddings back
+            )
+            fresh = [self._hits(found, row) for row in range(len(misses))]
+        for i, hits in zip(misses, fresh):
+            results[i] = hits
+            self._semantic_cache.put(query_vecs[i], (top_k, version, hits))
+        return results
+
+    def _search_quantized(self, query_vecs: np.ndarray, top_k: int):
+        """Shortlist on int8 codes, rerank with the fp16 sidecar, then fetch only the winners."""
+        all_hits = []
+        for qv in query_vecs:
+            ranked = self.index.search(qv, top_k, candidates=top_k * self.oversample)
+            if not ranked:
+                all_hits.append([])
+                continue
+            got = self.collection.get(
+                ids=[doc_id for doc_id, _ in ranked], include=["documents", "metadatas"]
+            )
+            by_id = dict(zip(got["ids"], zip(got["documents"], got["metadatas"])))
+            hits = []
+            for doc_id, sim in ranked:
+                if doc_id not in by_id:
+                    continue
+                doc, meta = by_id[doc_id]
+                hits.append({
+                    "id": doc_id,
+                    "question": _question(doc),
+                    "answer": meta.get("answer"),
+                    "doc": doc,
+                    "score": self.index.distance(sim),
+                    "metadata": meta
+                })
+            all_hits.append(hits)
+        return all_hits
+
+    @staticmethod
+    def _hits(results, i: int):
+        # Scores are distances (0 = perfect match); local binds + one comprehension per query
+        ids, docs = results["ids"][i], results["documents"][i]
+        metas, dists = results["metadatas"][i], results["distances"][i]
+        return [
+            {"id": d_id, "question": _question(d), "answer": m.get("answer"), "doc": d,
+             "score": s, "metadata": m}
+            for d_id, d, m, s in zip(ids, docs, metas, dists)
+        ]
+
+
+_retriever_lock = threading.Lock()
+_retrievers = {}
+
+# Per (db_path, collection_name); bumped by Retriever.clear_cache() on any instance
+_kb_versions = collections.Counter()
+_kb_versions_lock = threading.Lock()
+
+
+def get_retriever(db_path: str = "data/chroma", collection_name: str = "faq",
+                  quantized: bool = False, index_dir: str = INDEX_DIR, oversample: int = 8):
+    """
+    Process-wide Retriever per configuration, so the embedding model, Chroma
+    client and HNSW index are loaded once no matter how many modules use them.
+    """
+    key = (db_path, collection_name, quantized, index_dir, oversample)
+    with _retriever_lock:
+        if key not in _retrievers:
+            _retrievers[key] = Retriever(*key)
+        return _retrievers[key]
 
-        hits = []
-        for doc, meta, distance in zip(
-                results["documents"][0], 
-                results["metadatas"][0], 
-                results["distances"][0]
-            ):
-            hits.append({
-                "question": meta.get("question"),
-                "answer": meta.get("answer"),
-                "doc": doc,
-                # "score": 1 - distance  # if distance is 0=perfect match, convert to similarity
-                "score": distance  # use distance directly
-            })
-        return hits
 
+def refresh_retrievers(db_path: str = "data/chroma", collection_name: str = "faq"):
+    """Refresh every shared Retriever on this collection, e.g. after kb_ingest rebuilt it."""
+    with _retriever_lock:
+        shared = [r for (path, name, *_), r in _retrievers.items()
+                  if (path, name) == (db_path, collection_name)]
+    for retriever in shared:
+        retriever.refresh()
@@ -0,0 +1,189 @@
+# src/langie/tickets.py
+import json
+import os
+import sqlite3
+import threading
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# Ticket store: SQLite in WAL mode. Ticket ids come from a sequence row in the same
+# database, so every process (e.g. several uvicorn workers) draws from one sequence.
+# Tickets from the older JSONL / JSON-array files are imported on first boot.
+TICKETS_DB = "data/tickets.db"
+LEGACY_TICKETS_FILES = ("data/tickets.jsonl", "data/tickets.json")
+TICKETS_FSYNC = os.getenv("LANGIE_TICKETS_FSYNC", "0") == "1"
+
+# Tickets that could not be written even on their own are appended here (JSON lines)
+DEAD_LETTER_PATH = "data/tickets_failed.jsonl"
+
+# Ids are claimed ID_BLOCK at a time (one write transaction per block, not per ticket);
+# ids left in a process's block when it exits are skipped
+ID_BLOCK = 100
+
+# /chat resolves a ticket when the top KB hit is within the threshold for the collection's
+# distance space (scores are distances, lower = closer). The default, 0.125 cosine
+# distance (cosine similarity >= 0.875), is the bar the old squared-L2 threshold of 0.25
+# set on unit vectors, where L2 = 2 * cosine distance. The committed data/chroma is still
+# an L2 collection until scripts/kb_ingest.py rebuilds it.
+SCORE_THRESHOLD = float(os.getenv("LANGIE_SCORE_THRESHOLD", "0.125"))
+
+
+def score_threshold(space):
+    """Largest top-hit distance that resolves a ticket in `space` ("cosine" or "l2")."""
+    return 2 * SCORE_THRESHOLD if space == "l2" else SCORE_THRESHOLD
+
+
+def ticket_status(score, space):
+    if score is not None and score <= score_threshold(space):
+        return "resolved"
+    return "pending"
+
+
+def ticket_num(ticket):
+    return int(ticket["ticket_id"].split("-")[1])
+
+
+def _load_legacy_tickets(path):
+    """Read tickets from a JSON-lines file or an old JSON array file."""
+    with open(path, "r") as f:
+        if path.endswith(".jsonl"):
+            tickets = []
+            for line in f:
+                try:
+                    tickets.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+            return tickets
+        try:
+            return json.load(f)
+        except json.JSONDecodeError:
+            return []
+
+
+def open_ticket_db(path=TICKETS_DB):
+    # timeout: wait for other processes' write transactions instead of failing
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # FULL syncs the WAL on every commit; NORMAL only at checkpoints
+    conn.execute(f"PRAGMA synchronous={'FULL' if TICKETS_FSYNC else 'NORMAL'}")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS tickets("
+        "id INTEGER PRIMARY KEY, payload TEXT NOT NULL, ts TEXT)"
+    )
+    # Single row: the next id no process has claimed yet
+    conn.execute("CREATE TABLE IF NOT EXISTS ticket_seq(next INTEGER NOT NULL)")
+    with conn:
+        conn.execute("INSERT INTO ticket_seq SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM ticket_seq)")
+    return conn
+
+
+def migrate_legacy_tickets(conn):
+    """Import legacy ticket files into an empty tickets table (runs once)."""
+    if conn.execute("SELECT 1 FROM tickets LIMIT 1").fetchone():
+        return
+    rows = {}
+    for path in LEGACY_TICKETS_FILES:
+        if not os.path.exists(path):
+            continue
+        for ticket in _load_legacy_tickets(path):
+            try:
+                rows.setdefault(ticket_num(ticket), (json.dumps(ticket), ticket.get("timestamp")))
+            except Exception:
+                continue
+    with conn:
+        conn.executemany(
+            "INSERT OR IGNORE INTO tickets(id, payload, ts) VALUES(?, ?, ?)",
+            [(num, payload, ts) for num, (payload, ts) in sorted(rows.items())]
+        )
+
+
+class TicketStore:
+    """
+    Tickets in SQLite. reserve_id() hands out an id (TKT-<n>) from a block this
+    store claimed in the database, so ids are unique across threads and
+    processes while most calls touch no disk; save_many() writes the tickets.
+    The connection is shared, so its use is serialized by a lock; call both
+    from worker threads, not the event loop.
+    """
+
+    def __init__(self, path=TICKETS_DB, dead_letter_path=DEAD_LETTER_PATH):
+        self.path = path
+        self.dead_letter_path = dead_letter_path
+        self._conn = open_ticket_db(path)
+        self._lock = threading.Lock()
+        self._next_id = self._block_end = 0
+        with self._lock:
+            migrate_legacy_tickets(self._conn)
+
+    def reserve_id(self) -> str:
+        with self._lock:
+            if self._next_id >= self._block_end:
+                self._next_id, self._block_end = self._claim_block()
+            num = self._next_id
+            self._next_id += 1
+        return f"TKT-{num:03d}"
+
+    def _claim_block(self):
+        # Never below the highest stored id (imported or written by older versions)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE ticket_seq SET next = "
+                "MAX(next, (SELECT COALESCE(MAX(id), 0) + 1 FROM tickets)) + ?", (ID_BLOCK,)
+            )
+            end = self._conn.execute("SELECT next FROM ticket_seq").fetchone()[0]
+        return end - ID_BLOCK, end
+
+    def save_many(self, tickets):
+        """
+        Write tickets in one transaction (a re-saved ticket replaces its row). If the
+        batch fails, each ticket is retried on its own so one bad row cannot
+        lose the rest; tickets that still fail are dead-lettered and returned.
+        """
+        try:
+            self._write(tickets)
+            return []
+        except Exception:
+            if len(tickets) > 1:
+                logger.warning("Ticket batch of %d failed; retrying one by one", len(tickets))
+        failed = []
+        for ticket in tickets:
+            try:
+                self._write([ticket])
+            except Exception:
+                logger.exception("❌ Failed to persist ticket %s", ticket.get("ticket_id"))
+                failed.append(ticket)
+        if failed:
+            self._dead_letter(failed)
+        return failed
+
+    def save(self, ticket):
+        return self.save_many([ticket])
+
+    def _write(self, tickets):
+        rows = [(ticket_num(t), json.dumps(t), t.get("timestamp")) for t in tickets]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tickets(id, payload, ts) VALUES(?, ?, ?)", rows
+            )
+
+    def _dead_letter(self, tickets):
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for ticket in tickets:
+                    f.write(json.dumps(ticket, default=str) + "\n")
+        except OSError:
+            logger.exception("❌ Could not dead-letter tickets: %r", tickets)
+
+    def get(self, ticket_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload FROM tickets WHERE id = ?", (int(ticket_id.split("-")[1]),)
+            ).fetchone()
+        # "{}": an id placeholder left by earlier versions whose ticket was never written
+        return json.loads(row[0]) if row and row[0] != "{}" else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,40 @@
+import re
+
+from src.langie.abilities import _find_order_id, parse_request_text, store_answer
+
+TEXTS = [
+    "",
+    "no id here",
+    "My order #123 hasn't arrived",
+    "#45 and #678",
+    "# 12 then #34",
+    "issue #x, order #9",
+    "trailing #",
+    "order 98765, see attachment #1",
+    "12345",
+    "full-width #１２３",
+    "٣٤٥ (Arabic-Indic digits)",
+]
+
+
+def test_find_order_id_matches_regex():
+    for text in TEXTS:
+        m = re.search(r"#\d+", text)
+        assert _find_order_id(text) == (m.group() if m else None), text
+
+
+def test_parse_request_text_order_id():
+    state = parse_request_text({"query": "Where is order #4521?", "entities": {}})
+    assert state["entities"]["order_id"] == "#4521"
+
+
+def test_store_answer_takes_first_number():
+    # Regression: '#<digits>' used to win over an earlier bare number
+    state = store_answer({"clarification_answer": "order 98765, see attachment #1"})
+    assert state["entities"]["order_id"] == "98765"
+
+    for text in TEXTS:
+        state = store_answer({"clarification_answer": text})
+        m = re.search(r"#?\d+", text)
+        assert state.get("entities", {}).get("order_id") == (m.group().lstrip("#") if m else None), text
+        assert state["answers"] == [text]
@@ -0,0 +1,68 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import app as chat_app
+from pipeline.abilities.knowledge_base_search import KBHit
+from src.langie.cache import LRUCache
+from src.langie.tickets import TicketStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """The FastAPI app with a temp ticket store and a KB search that records its queries."""
+    store = TicketStore(str(tmp_path / "tickets.db"), str(tmp_path / "failed.jsonl"))
+    monkeypatch.setattr(chat_app, "ticket_store", store)
+    monkeypatch.setattr(chat_app, "_recent_queries", LRUCache())
+    searches = []
+
+    async def arun(state):
+        searches.append(state["input"]["text"])
+        state["knowledge_base"] = [KBHit("faq_001", "Where is my order?", "Track it online.", 0.05, {})]
+        return state
+
+    monkeypatch.setattr(chat_app.kb_search, "arun", arun)
+    with TestClient(chat_app.app) as c:
+        c.searches = searches
+        yield c
+    store.close()
+
+
+def _chat(client, query, email="alice@example.com"):
+    resp = client.post("/chat", json={"customer_name": "Alice", "email": email, "query": query})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_trivial_queries_skip_kb_search(client):
+    for query in ["hi", "Hello!", "thank you.", "ok", "ab", "   "]:
+        ticket = _chat(client, query)
+        assert (ticket["status"], ticket["response"]) == ("pending", "No response generated")
+    assert client.searches == []
+    assert not chat_app.skip_kb_search("Where is my order?")
+
+
+def test_repeated_query_reuses_results(client, monkeypatch):
+    first = _chat(client, "Where is my order?")
+    # Same email within DEDUP_WINDOW_SECONDS: no second search, same answer
+    assert _chat(client, " Where is my order? ")["response"] == first["response"]
+    assert client.searches == ["Where is my order?"]
+
+    # Another customer, or the same one after the window, searches again
+    _chat(client, "Where is my order?", email="bob@example.com")
+    monkeypatch.setattr(chat_app, "DEDUP_WINDOW_SECONDS", -1)
+    _chat(client, "Where is my order?")
+    assert len(client.searches) == 3
+
+
+@pytest.mark.parametrize("body, status", [
+    (b"not json", 400),
+    (b'{"customer_name": "Alice", "email": "a@example.com"', 400),  # truncated
+    (b'{"customer_name": "Alice", "email": "a@example.com"}', 422),  # missing query
+    (b'{"customer_name": "Alice", "email": "a@example.com", "query": 42}', 422),
+    (b'["Alice", "a@example.com", "Where is my order?"]', 422),
+])
+def test_invalid_payloads(client, body, status):
+    resp = client.post("/chat", content=body, headers={"content-type": "application/json"})
+    assert resp.status_code == status
+    assert resp.json()["detail"]
+    assert client.searches == []
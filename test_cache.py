@@ -0,0 +1,59 @@
+import numpy as np
+
+from src.langie.cache import EmbeddingCache, LRUCache, SemanticCache
+
+
+def _unit(i, dim=8):
+    v = np.zeros(dim, dtype=np.float32)
+    v[i] = 1.0
+    return v
+
+
+def test_lru_cache_evicts_least_recent():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+
+def test_semantic_cache_ring_buffer():
+    cache = SemanticCache(maxsize=2, threshold=0.97)
+    for i in range(3):
+        cache.put(_unit(i), f"hits-{i}")
+
+    # The third insert overwrote the oldest slot
+    assert cache.get(_unit(0)) is None
+    assert cache.get(_unit(1)) == "hits-1"
+    assert cache.get(_unit(2)) == "hits-2"
+
+    # Close enough to a stored query hits; below the threshold misses
+    near = _unit(2) + 0.1 * _unit(3)
+    assert cache.get(near / np.linalg.norm(near)) == "hits-2"
+    far = _unit(2) + _unit(3)
+    assert cache.get(far / np.linalg.norm(far)) is None
+
+    cache.clear()
+    assert cache.get(_unit(2)) is None
+    cache.put(_unit(4), "hits-4")
+    assert cache.get(_unit(4)) == "hits-4"
+
+
+def test_embedding_cache_is_bounded(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"), maxsize=3)
+    for i in range(5):
+        cache.put_many({bytes([i]): _unit(i)})
+    assert len(cache) == 3
+
+    got = cache.get_many([bytes([i]) for i in range(5)])
+    assert got[0] is None and got[1] is None
+    assert got[4].dtype == np.float16
+    np.testing.assert_array_equal(got[4], _unit(4))
+    cache.close()
+
+    # Entries persist across handles
+    reopened = EmbeddingCache(str(tmp_path / "emb.sqlite3"), maxsize=3)
+    assert reopened.get_many([bytes([3])])[0] is not None
+    reopened.close()
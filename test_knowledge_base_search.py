@@ -0,0 +1,73 @@
+import asyncio
+
+from pipeline.abilities.knowledge_base_search import BatchingRetriever, KnowledgeBaseSearch
+from src.langie.quantization import QuantizedIndex
+from src.langie.retriever import get_retriever
+
+SEED = [
+    {"id": "faq_001", "question": "How do I track my order?", "answer": "Use the tracking link in your email."},
+    {"id": "faq_002", "question": "What is your refund policy?", "answer": "Refunds within 30 days."},
+]
+
+
+def _kb(tmp_path, **config):
+    """A seeded KB under tmp_path, searched through KnowledgeBaseSearch (like the app)."""
+    db_path, index_dir = str(tmp_path / "chroma"), str(tmp_path / "kb_index")
+    writer = get_retriever(db_path=db_path, index_dir=index_dir)
+    embeddings = writer.bulk_upsert(SEED)
+    QuantizedIndex.build([r["id"] for r in SEED], embeddings, space="cosine").save(index_dir)
+    return writer, KnowledgeBaseSearch({"db_path": db_path, "index_dir": index_dir, **config})
+
+
+def test_added_faq_invalidates_cached_results(tmp_path):
+    # The app searches with a quantized Retriever; add_faq runs on another instance
+    writer, kb = _kb(tmp_path, quantized=True, top_k=1)
+    query = "Do you ship to Jupiter?"
+    assert kb.search_many([query])[0][0].answer != "Not yet."
+
+    writer.add_faq(query, "Not yet.", kb_path=str(tmp_path / "kb_faq.jsonl"))
+    assert kb.search_many([query])[0][0].answer == "Not yet."
+
+
+class _RecordingRetriever:
+    """Stands in for a Retriever: records search_many calls, returns numbered hits."""
+
+    def __init__(self):
+        self.calls = []
+
+    def search_many(self, queries, top_k):
+        self.calls.append((list(queries), top_k))
+        return [[f"{q}-{i}" for i in range(top_k)] for q in queries]
+
+
+def test_batcher_fans_out_one_search():
+    retriever = _RecordingRetriever()
+
+    async def run():
+        batcher = BatchingRetriever(retriever, window_ms=50)
+        return await asyncio.gather(*(batcher.search(f"q{i}", top_k=1 + i % 3) for i in range(5)))
+
+    results = asyncio.run(run())
+    # One call with every query at the largest top_k; each caller gets its own slice
+    assert retriever.calls == [([f"q{i}" for i in range(5)], 3)]
+    assert results == [[f"q{i}-{j}" for j in range(1 + i % 3)] for i in range(5)]
+
+
+def test_exact_cache_hit_skips_the_batcher(tmp_path):
+    _, kb = _kb(tmp_path, top_k=1)
+    state = {"input": {"text": "How do I track my order?"}}
+    first = asyncio.run(kb.arun(dict(state)))["knowledge_base"]
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("exact-cache hit went through the batcher")
+
+    kb.batcher.search = fail
+    assert asyncio.run(kb.arun(dict(state)))["knowledge_base"] == first
+
+
+def test_hits_carry_chroma_ids(tmp_path):
+    for quantized in (False, True):
+        _, kb = _kb(tmp_path / str(quantized), quantized=quantized, top_k=1)
+        hit = kb.search_many(["What is your refund policy?"])[0][0]
+        assert hit.id == "faq_002"
+        assert hit.metadata["answer"] == hit.answer
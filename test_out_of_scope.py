@@ -1,20 +1,20 @@
-from src.langie.retriever import Retriever
+from src.langie.retriever import get_retriever
 
-def test_out_of_scope():
-    retriever = Retriever()
+def test_out_of_scope(retriever):
     queries = [
         "What is your hiring process?",
         "Tell me about stock market trends",
         "Who is the CEO of the company?"
     ]
 
-    for query in queries:
+    # One batched encode + Chroma query for all queries
+    all_results = retriever.search_many(queries, top_k=1)
+    for query, results in zip(queries, all_results):
         print(f"\n❓ Query: {query}")
-        results = retriever.retrieve(query, top_k=1)
         if results:
             print(f"   ➡️ Closest match: {results[0]['answer']} (Q: {results[0]['question']})")
         else:
             print("   🚫 No relevant match found.")
 
 if __name__ == "__main__":
-    test_out_of_scope()
+    test_out_of_scope(get_retriever())
@@ -1,8 +1,11 @@
 # test_pipeline.py
 import json
 from pathlib import Path
+from types import SimpleNamespace
 import importlib
 import logging
+import pytest
+from src.langie import pipeline
 from src.langie.pipeline import LangGraphAgent
 import src.langie.abilities as abilities
 
@@ -82,3 +85,117 @@ def test_pipeline_smoke(sample_path="sample.json", config_path="config/stages.ya
 # -------------------------------
 if __name__ == "__main__":
     result = test_pipeline_smoke()
+
+# -------------------------------
+# Compiled plan vs. the original stage walk
+# -------------------------------
+PLAN_CONFIG = """
+stages:
+  - name: INTAKE
+    abilities:
+      - { name: accept_payload, server: COMMON }
+  - name: CLARIFY
+    mode: conditional
+    condition: missing_entities
+    abilities:
+      - { name: clarify_question, server: ATLAS }
+  - name: UNDERSTAND
+    mode: deterministic
+    abilities:
+      - { name: extract_entities, server: ATLAS }
+  - name: RECHECK
+    mode: conditional
+    condition: missing_entities
+    abilities:
+      - { name: clarify_question, server: ATLAS }
+  - name: RETRIEVE
+    mode: deterministic
+    abilities:
+      - { name: knowledge_base_search, server: ATLAS }
+  - name: DECIDE
+    mode: non-deterministic
+    abilities:
+      - { name: update_payload,      server: COMMON }
+      - { name: solution_evaluation, server: COMMON }
+      - { name: escalation_decision, server: ATLAS }
+      - { name: solution_evaluation, server: COMMON }
+      - { name: escalation_decision, server: COMMON }
+  - name: FOLLOW_UP
+    mode: conditional
+    condition: low_confidence
+    abilities:
+      - { name: notify_customer, server: ATLAS }
+  - name: MYSTERY
+    mode: parallel
+    abilities:
+      - { name: never_runs, server: COMMON }
+"""
+
+
+def _fake_abilities(score):
+    """Ability results that drive every branch: entities appear, then a fixed score."""
+    results = {
+        "extract_entities": {"entities": {"issue": "delivery_delay"}},
+        "solution_evaluation": {"solution_score": score},
+    }
+    return lambda name, state: dict(results.get(name, {}))
+
+
+def _reference_calls(stages, state, ability):
+    """The order in which LangGraphAgent.run called abilities before the plan was compiled."""
+    calls = []
+
+    def execute(a):
+        calls.append((a["name"], a.get("server", "COMMON")))
+        state.update(ability(a["name"], state))
+
+    for stage in stages:
+        mode = stage.get("mode", "deterministic")
+        abilities = stage.get("abilities", [])
+        if mode == "deterministic":
+            for a in abilities:
+                execute(a)
+        elif mode == "conditional":
+            if LangGraphAgent._eval_condition(SimpleNamespace(state=state), stage.get("condition", "")):
+                for a in abilities:
+                    execute(a)
+        elif mode == "non-deterministic":
+            for a in abilities:
+                if a["name"] == "solution_evaluation":
+                    execute(a)
+                    break
+            if state.get("solution_score", 0) < 90:
+                for a in abilities:
+                    if a["name"] == "escalation_decision":
+                        execute(a)
+            for a in abilities:
+                if a["name"] == "update_payload":
+                    execute(a)
+    return calls
+
+
+@pytest.mark.parametrize("config_name", ["stages.yaml", "plan.yaml"])
+@pytest.mark.parametrize("score", [50, 85, 95])
+def test_compiled_plan_matches_stage_walk(tmp_path, monkeypatch, config_name, score):
+    config_path = Path("config/stages.yaml") if config_name == "stages.yaml" else tmp_path / config_name
+    if config_name != "stages.yaml":
+        config_path.write_text(PLAN_CONFIG)
+    ability = _fake_abilities(score)
+    calls = []
+
+    def route(server):
+        def call(name, state):
+            calls.append((name, server))
+            return ability(name, state)
+        return call
+
+    monkeypatch.setattr(pipeline, "call_common", route("COMMON"))
+    monkeypatch.setattr(pipeline, "call_atlas", route("ATLAS"))
+    monkeypatch.setattr(LangGraphAgent, "_kb_search",
+                        lambda self, state: route("ATLAS")("knowledge_base_search", state))
+    sample = json.loads(Path("sample.json").read_text())
+
+    agent = LangGraphAgent(config_path=str(config_path))
+    expected = _reference_calls(agent.config["stages"], agent.validate_input(sample), ability)
+    agent.run(sample)
+    assert calls == expected
@@ -0,0 +1,110 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.langie.quantization import QuantizedIndex, _append_rows, normalize
+
+DIM = 384
+
+
+def _vectors(n, seed):
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def _recall(index, docs, queries, k=3, candidates=24):
+    """Fraction of the exact top-k (brute-force cosine) that the index returns."""
+    docs = normalize(docs)
+    found = 0
+    for q in queries:
+        exact = set(np.argsort(-(docs @ normalize(q[None])[0]))[:k])
+        got = {int(doc_id) for doc_id, _ in index.search(q, k, candidates=candidates)}
+        found += len(exact & got)
+    return found / (k * len(queries))
+
+
+def test_sq8_recall():
+    # 300 rows: below the prefilter cutoff, so every row is int8-scored
+    docs, queries = _vectors(300, 0), _vectors(50, 1)
+    index = QuantizedIndex.build([str(i) for i in range(len(docs))], docs, space="cosine")
+    assert _recall(index, docs, queries) >= 0.97
+
+
+def test_binary_prefilter_recall():
+    # 2000 rows: the sign-bit Hamming pass picks 24 * 16 rows first. Random 384-d data
+    # is its worst case (no cluster structure); it measures 0.87 with these seeds.
+    docs, queries = _vectors(2000, 0), _vectors(50, 1)
+    index = QuantizedIndex.build([str(i) for i in range(len(docs))], docs, space="cosine")
+    assert _recall(index, docs, queries) >= 0.8
+
+    # Near-duplicate queries (the FAQ regime) must still find their document first
+    rng = np.random.default_rng(2)
+    rows = rng.integers(0, len(docs), 50)
+    noisy = docs[rows] + 0.1 * rng.standard_normal((50, DIM)).astype(np.float32)
+    assert [int(index.search(q, 1)[0][0]) for q in noisy] == list(rows)
+
+
+def test_add_save_load_roundtrip(tmp_path):
+    docs = _vectors(500, 3)
+    index = QuantizedIndex.build([str(i) for i in range(len(docs))], docs, space="cosine")
+    index.save(str(tmp_path))
+
+    loaded = QuantizedIndex.load(str(tmp_path))
+    assert loaded.ids == index.ids and loaded.space == "cosine"
+    assert isinstance(loaded.vectors, np.memmap)
+    query = _vectors(1, 4)[0]
+    assert loaded.search(query, 3, candidates=24) == index.search(query, 3, candidates=24)
+
+    # Appended rows are found, and survive another save/load
+    extra = _vectors(2, 5)
+    loaded.add(["new-0", "new-1"], extra)
+    loaded.save(str(tmp_path))
+    reloaded = QuantizedIndex.load(str(tmp_path))
+    assert len(reloaded.ids) == len(reloaded.codes) == len(reloaded.vectors) == 502
+    assert reloaded.search(extra[1], 1)[0][0] == "new-1"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_concurrent_appends_keep_every_row(tmp_path):
+    path = str(tmp_path)
+    QuantizedIndex.build([str(i) for i in range(100)], _vectors(100, 6), space="cosine").save(path)
+    reader = QuantizedIndex.load(path)  # memory-maps vectors_f16.npy
+    inode = os.stat(tmp_path / "vectors_f16.npy").st_ino
+
+    extra = _vectors(16, 7)
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        list(ex.map(lambda i: QuantizedIndex.append(path, [f"new-{i}"], extra[i]), range(16)))
+
+    loaded = QuantizedIndex.load(path)
+    assert sorted(loaded.ids[100:]) == sorted(f"new-{i}" for i in range(16))
+    for i in range(16):
+        assert loaded.search(extra[i], 1)[0][0] == f"new-{i}"
+    # Grown in place: same file, and the earlier mapping still reads its rows
+    assert os.stat(tmp_path / "vectors_f16.npy").st_ino == inode
+    np.testing.assert_array_equal(reader.vectors, loaded.vectors[:100])
+    assert not QuantizedIndex.append(str(tmp_path / "missing"), ["x"], extra[0])
+
+
+def test_load_ignores_rows_of_an_interrupted_append(tmp_path):
+    path = str(tmp_path)
+    docs = _vectors(10, 8)
+    QuantizedIndex.build([str(i) for i in range(10)], docs).save(path)
+    # Rows written to one array file, but index.json was never replaced
+    _append_rows(os.path.join(path, "sq8_codes.npy"), np.ones((3, DIM), dtype=np.int8), 10)
+    assert len(QuantizedIndex.load(path).codes) == 10
+
+    QuantizedIndex.append(path, ["new"], docs[0])
+    loaded = QuantizedIndex.load(path)
+    assert len(loaded.ids) == len(loaded.codes) == len(loaded.bits) == len(loaded.vectors) == 11
+    np.testing.assert_array_equal(loaded.codes[10], loaded.codes[0])
+
+    # Fewer rows than ids is an error
+    np.save(tmp_path / "sq8_codes.npy", np.zeros((9, DIM), dtype=np.int8))
+    with pytest.raises(ValueError):
+        QuantizedIndex.load(path)
+
+
+def test_distance():
+    assert QuantizedIndex([], None, None, space="cosine").distance(0.75) == pytest.approx(0.25)
+    assert QuantizedIndex([], None, None, space="l2").distance(0.75) == pytest.approx(0.5)
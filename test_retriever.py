@@ -1,7 +1,9 @@
-from src.langie.retriever import Retriever
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 
-def run_tests():
-    retriever = Retriever()
+from src.langie.retriever import EMBED_CACHE_FILE, Retriever, get_retriever
+
+def test_retriever(retriever):
     queries = [
         "How do I return a product?",
         "What should I do if my order is delayed?",
@@ -10,11 +12,39 @@ def run_tests():
         "Do you offer international shipping?"
     ]
 
-    for query in queries:
+    # One batched encode + Chroma query for all queries
+    all_results = retriever.search_many(queries, top_k=2)
+    for query, results in zip(queries, all_results):
         print(f"\n🔍 Query: {query}")
-        results = retriever.retrieve(query, top_k=2)
         for idx, res in enumerate(results, start=1):
             print(f"   {idx}. {res['answer']} (Q: {res['question']})")
 
+    # Many small concurrent searches (the server's regime) must agree with the batch
+    retriever.clear_cache()
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        threaded = list(ex.map(lambda q: retriever.search(q, top_k=2), queries))
+    for query, batch_hits, hits in zip(queries, all_results, threaded):
+        assert [h["answer"] for h in hits] == [h["answer"] for h in batch_hits], query
+    print(f"\n✅ {len(queries)} concurrent searches match the batched results")
+
+def test_broken_embedding_cache_falls_back(tmp_path, monkeypatch):
+    # A corrupt cache file: the Retriever still loads and encodes queries itself
+    db_path = tmp_path / "corrupt"
+    db_path.mkdir()
+    (db_path / EMBED_CACHE_FILE).write_bytes(b"not a database" * 512)
+    retriever = Retriever(db_path=str(db_path))
+    assert retriever._emb_cache is None
+    assert retriever.embed(["Where is my order?"]).shape[0] == 1
+
+    # A cache that starts failing later is disabled instead of failing searches
+    retriever = Retriever(db_path=str(tmp_path / "healthy"))
+
+    def malformed(*args, **kwargs):
+        raise sqlite3.DatabaseError("database disk image is malformed")
+
+    monkeypatch.setattr(retriever._emb_cache, "get_many", malformed)
+    assert retriever.embed(["Where is my order?"]).shape[0] == 1
+    assert retriever._emb_cache is None
+
 if __name__ == "__main__":
-    run_tests()
+    test_retriever(get_retriever())
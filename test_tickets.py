@@ -0,0 +1,90 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.langie import tickets
+from src.langie.tickets import TicketStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # Legacy ticket files are looked up relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    store = TicketStore(str(tmp_path / "tickets.db"), str(tmp_path / "failed.jsonl"))
+    yield store
+    store.close()
+
+
+def _ticket(ticket_id, query="Where is my order?"):
+    return {"ticket_id": ticket_id, "query": query, "status": "pending", "timestamp": "2025-01-01T00:00:00"}
+
+
+def _num(ticket_id):
+    return int(ticket_id.split("-")[1])
+
+
+def test_reserved_ids_are_unique(store, tmp_path):
+    assert store.reserve_id() == "TKT-001"
+    # A second store on the same file stands in for another worker process
+    other = TicketStore(str(tmp_path / "tickets.db"))
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        ids = list(ex.map(lambda i: (store, other)[i % 2].reserve_id(), range(500)))
+    other.close()
+    assert len(set(ids)) == 500
+    assert "TKT-001" not in ids
+
+
+def test_reserving_ids_writes_no_rows(store):
+    ticket_id = store.reserve_id()
+    assert store.get(ticket_id) is None
+    assert store._conn.execute("SELECT COUNT(*) FROM tickets").fetchone()[0] == 0
+
+
+def test_tickets_persist(store, tmp_path):
+    first, second = store.reserve_id(), store.reserve_id()
+    assert store.save_many([_ticket(first), _ticket(second)]) == []
+    store.close()
+
+    # A new store on the same file (e.g. another worker) sees the tickets and
+    # continues the id sequence
+    reopened = TicketStore(str(tmp_path / "tickets.db"))
+    assert reopened.get(second) == _ticket(second)
+    assert _num(reopened.reserve_id()) > _num(second)
+    reopened.close()
+
+
+def test_bad_ticket_is_dead_lettered(store, tmp_path):
+    good = store.reserve_id()
+    bad = _ticket("not-a-ticket-id")
+    assert store.save_many([_ticket(good), bad]) == [bad]
+    assert store.get(good) == _ticket(good)
+    with open(tmp_path / "failed.jsonl") as f:
+        assert [json.loads(line) for line in f] == [bad]
+
+
+def test_legacy_tickets_are_imported(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "data").mkdir()
+    with open(tmp_path / "data" / "tickets.jsonl", "w") as f:
+        f.write(json.dumps(_ticket("TKT-007")) + "\n")
+    store = TicketStore(str(tmp_path / "tickets.db"))
+    assert store.get("TKT-007") == _ticket("TKT-007")
+    assert store.reserve_id() == "TKT-008"
+    store.close()
+
+
+def test_ticket_status_per_space(monkeypatch):
+    assert tickets.score_threshold("cosine") == tickets.SCORE_THRESHOLD == 0.125
+    assert tickets.score_threshold("l2") == 0.25  # squared L2 = 2 * cosine distance
+
+    assert tickets.ticket_status(0.125, "cosine") == "resolved"
+    assert tickets.ticket_status(0.2, "cosine") == "pending"
+    assert tickets.ticket_status(0.2, "l2") == "resolved"
+    assert tickets.ticket_status(0.3, "l2") == "pending"
+    assert tickets.ticket_status(None, "cosine") == "pending"
+
+    # LANGIE_SCORE_THRESHOLD sets the cosine threshold; L2 follows it
+    monkeypatch.setattr(tickets, "SCORE_THRESHOLD", 0.2)
+    assert tickets.ticket_status(0.2, "cosine") == "resolved"
+    assert tickets.ticket_status(0.45, "l2") == "pending"